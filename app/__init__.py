@@ -1,17 +1,69 @@
+import orjson
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 from config import config
 
+from . import hashing
+
 db = SQLAlchemy()
+cache = Cache()
+
+SQLITE_PRAGMAS = (
+    # readers don't block on writers
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    # 64 MB page cache, 256 MB memory mapped I/O
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, used by :func:`flask.jsonify` and
+    :attr:`flask.Request.json`. Types orjson does not support natively fall back to
+    Flask's default serialization."""
+
+    def _dumpb(self, obj):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps(self, obj, **kwargs):
+        return self._dumpb(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # encode straight to the bytes of the body, without a round trip through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumpb(obj), mimetype=self.mimetype)
 
 
 def create_app(config_name="default"):
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
     app.config.from_object(config[config_name])
 
     config[config_name].init_app(app)
     db.init_app(app)
+    cache.init_app(app)
+
+    # only on the engine of this app, other engines in the process keep their settings
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            event.listen(db.engine, "connect", set_sqlite_pragmas)
+
+    hashing.init_app(app)
 
     from .routes import api as api_blueprint
 
@@ -0,0 +1,63 @@
+from functools import wraps
+from uuid import uuid4
+
+from flask import current_app, request
+
+from . import cache
+
+
+def cached_response(timeout, version_key):
+    """
+    Cache successful responses of a GET view, by full path (including the query string).
+    Only the body and headers are stored, so cache hits skip serialization.
+
+    :param timeout: How long to keep responses for, in seconds.
+    :type timeout: int
+
+    :param version_key: Cache key of a version token that is replaced when the
+        underlying data changes, see :func:`invalidate`.
+    :type version_key: str
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = "view/{}/{}/{}".format(
+                version_key, _version(version_key), request.full_path
+            )
+
+            if (cached := cache.get(key)) is not None:
+                body, headers = cached
+                return current_app.response_class(body, headers=headers)
+
+            response = current_app.make_response(f(*args, **kwargs))
+
+            if response.status_code == 200:
+                cache.set(
+                    key,
+                    (response.get_data(), list(response.headers.items())),
+                    timeout=timeout,
+                )
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _version(version_key):
+    """Current version of ``version_key``. Versions are random tokens that never expire,
+    so if the key is evicted anyway, a new token is used instead of reusing an old one."""
+    version = cache.get(version_key)
+
+    if version is None:
+        cache.add(version_key, uuid4().hex, timeout=0)
+        version = cache.get(version_key)
+
+    return version
+
+
+def invalidate(version_key):
+    """Invalidate all responses cached by :func:`cached_response` with ``version_key``"""
+    cache.set(version_key, uuid4().hex, timeout=0)
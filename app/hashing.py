@@ -0,0 +1,125 @@
+"""
+Password hashing configuration. Argon2id parameters are calibrated once per host so that
+a single hash takes roughly ``AUTH_TARGET_MS`` milliseconds, and are then persisted so
+that restarts do not need to benchmark again.
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from argon2 import PasswordHasher
+from flask import current_app, has_app_context
+
+# memory cost recommended by OWASP for Argon2id, in KiB
+OWASP_MEMORY_COST = 46 * 1024
+
+#: Hasher used outside of an application context, using the OWASP recommended parameters
+default_hasher = PasswordHasher(
+    time_cost=3, memory_cost=OWASP_MEMORY_COST, parallelism=1
+)
+
+# upper bound for calibration, so a misconfigured target cannot stall every login
+MAX_TIME_COST = 10
+
+
+def _median_ms(hasher, runs=5):
+    """Median wall-clock time of hashing with ``hasher``, in milliseconds"""
+    timings = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        hasher.hash("x")
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(timings)
+
+
+def calibrate(target_ms, max_memory_cost=OWASP_MEMORY_COST):
+    """
+    Find the largest Argon2id parameters whose median hash time is within ``target_ms``.
+    Memory cost is raised first (from 8 MiB, doubling) up to ``max_memory_cost``, and the
+    remaining time is spent on time cost.
+
+    :param target_ms: Target time in milliseconds for a single hash.
+    :type target_ms: int
+
+    :param max_memory_cost: Memory budget of a single hash in KiB.
+    :type max_memory_cost: int
+
+    :return: Keyword arguments for :class:`argon2.PasswordHasher`.
+    """
+    params = {
+        "time_cost": 1,
+        "memory_cost": min(8 * 1024, max_memory_cost),
+        "parallelism": 1,
+    }
+
+    while params["memory_cost"] < max_memory_cost:
+        candidate = dict(
+            params, memory_cost=min(params["memory_cost"] * 2, max_memory_cost)
+        )
+        if _median_ms(PasswordHasher(**candidate)) > target_ms:
+            break
+        params = candidate
+
+    while params["time_cost"] < MAX_TIME_COST:
+        candidate = dict(params, time_cost=params["time_cost"] + 1)
+        if _median_ms(PasswordHasher(**candidate)) > target_ms:
+            break
+        params = candidate
+
+    return params
+
+
+def _write_params(path, params):
+    """Write ``params`` to ``path`` atomically, so other workers starting at the same
+    time never read a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(params, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def init_app(app):
+    """
+    Set up the password hasher for ``app``. Parameters are taken from ``ARGON2_PARAMS`` if
+    configured, otherwise from the file at ``ARGON2_PARAMS_PATH`` (by default in the
+    instance folder). If neither exists or the file cannot be read, the host is calibrated
+    and the file is written.
+    """
+    params = app.config.get("ARGON2_PARAMS")
+
+    if params is None:
+        path = app.config.get("ARGON2_PARAMS_PATH") or os.path.join(
+            app.instance_path, "argon2.json"
+        )
+
+        try:
+            with open(path) as f:
+                params = json.load(f)
+        except (OSError, ValueError):
+            # missing, or unreadable (e.g. truncated), so calibrate as on first start
+            params = calibrate(
+                app.config["AUTH_TARGET_MS"], app.config["ARGON2_MAX_MEMORY_COST"]
+            )
+            _write_params(path, params)
+
+    app.extensions["ph"] = PasswordHasher(**params)
+
+
+def get_hasher():
+    """The password hasher of the current app, or :data:`default_hasher` if there is
+    none."""
+    if has_app_context():
+        return current_app.extensions.get("ph", default_hasher)
+
+    return default_hasher
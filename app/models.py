@@ -9,18 +9,45 @@ foreign key on the :class:`Post` relation.
 """
 import time
 from datetime import datetime
+from functools import lru_cache
 
 import jwt
+from argon2.exceptions import InvalidHashError, VerificationError
 from flask import current_app
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy.orm import load_only, validates
+from werkzeug.security import check_password_hash
 
 from app import db
+from app.hashing import get_hasher
+
+# decoded auth tokens are reused for this many seconds, so that bursts of requests with
+# the same token skip verification
+TOKEN_CACHE_WINDOW = 5
+
+
+@lru_cache(maxsize=4096)
+def _decode_auth_token(token, secret_key, window):
+    """Payload of ``token``, or None if it is invalid. ``window`` is only part of the
+    cache key, so that entries are not reused past their :data:`TOKEN_CACHE_WINDOW`."""
+    try:
+        return jwt.decode(token, secret_key, algorithms="HS256")
+    except:
+        return None
+
 
 post_interest = db.Table(
     "post_interest",
-    db.Column("post_id", db.Integer, db.ForeignKey("post.id", ondelete="CASCADE")),
     db.Column(
-        "interest_id", db.Integer, db.ForeignKey("interest.id", ondelete="CASCADE")
+        "post_id",
+        db.Integer,
+        db.ForeignKey("post.id", ondelete="CASCADE"),
+        index=True,
+    ),
+    db.Column(
+        "interest_id",
+        db.Integer,
+        db.ForeignKey("interest.id", ondelete="CASCADE"),
+        index=True,
     ),
 )
 
@@ -36,7 +63,7 @@ class Publisher(db.Model):
     :param name: Real name provided by publisher.
     :type name: str
 
-    :param email: Email provided by publisher. Used for login.
+    :param email: Email provided by publisher, stored lowercase. Used for login.
     :type email: str
 
     :param password_hash: Hash of the password for authenticating the user.
@@ -51,10 +78,25 @@ class Publisher(db.Model):
 
     id = db.Column(db.Integer, autoincrement=True, primary_key=True)
     name = db.Column(db.String(256))
-    email = db.Column(db.String(512))
-    password_hash = db.Column(db.String(200))
+    email = db.Column(db.String(512), unique=True, index=True)
+    password_hash = db.Column(db.String(256))
     full_admin = db.Column(db.Boolean, nullable=False, default=False)
 
+    # emails are only stored normalized, see normalize_email
+    __table_args__ = (
+        db.CheckConstraint("email = lower(email)", name="ck_publisher_email_lower"),
+    )
+
+    @staticmethod
+    def normalize_email(email):
+        """Normalize an email for storage and lookup, i.e. lowercase without surrounding
+        whitespace."""
+        return email.lower().strip() if email else email
+
+    @validates("email")
+    def _normalize_email(self, key, email):
+        return self.normalize_email(email)
+
     @property
     def password(self):
         """Property representing publisher password. This converts setter calls to
@@ -63,32 +105,59 @@ class Publisher(db.Model):
 
     @password.setter
     def password(self, password):
-        """Set the password. This generates a hash via Werkzeug"""
-        self.password_hash = generate_password_hash(password)
+        """Set the password. This generates an Argon2id hash"""
+        self.password_hash = get_hasher().hash(password)
 
     def check_password(self, password):
-        """Check that the provided password hashes to the hash stored in the database"""
-        return check_password_hash(self.password_hash, password)
+        """Check that the provided password hashes to the hash stored in the database.
+
+        Legacy Werkzeug (e.g. pbkdf2) hashes are still accepted, and are rehashed with
+        Argon2id on a successful check, as are Argon2 hashes with outdated parameters. The
+        caller is responsible for committing the updated hash."""
+        if self.password_hash is None:
+            return False
+
+        if not self.password_hash.startswith("$argon2"):
+            if not check_password_hash(self.password_hash, password):
+                return False
+
+            self.password = password
+            return True
+
+        hasher = get_hasher()
+
+        try:
+            hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+        if hasher.check_needs_rehash(self.password_hash):
+            self.password = password
+
+        return True
 
     @classmethod
     def verify_auth_token(cls, token):
-        try:
-            data = jwt.decode(
-                token,
-                current_app.config["SECRET_KEY"],
-                algorithms="HS256",
-            )
-        except:
+        now = time.time()
+        data = _decode_auth_token(
+            token, current_app.config["SECRET_KEY"], int(now) // TOKEN_CACHE_WINDOW
+        )
+
+        if data is None:
             return None
+
+        if data["expires"] > now:
+            # the password hash is not needed for token authentication
+            return cls.query.options(
+                load_only(cls.name, cls.email, cls.full_admin)
+            ).get(data["id"])
         else:
-            if data["expires"] > time.time():
-                return cls.query.get(data["id"])
-            else:
-                return None
+            return None
 
-    def generate_auth_token(self, expiration):
+    @staticmethod
+    def encode_auth_token(id, expires):
         return jwt.encode(
-            {"id": self.id, "expires": time.time() + expiration},
+            {"id": id, "expires": expires},
             current_app.config["SECRET_KEY"],
             algorithm="HS256",
         )
@@ -134,6 +203,13 @@ class Post(db.Model):
     :param binary_content: Multimedia content of post (base 64 encoded)
     :type binary_content: str
 
+    :param has_media: Whether this Post has :attr:`binary_content`. Set automatically.
+    :type has_media: bool
+
+    :param has_preview: Whether this Post has a :attr:`preview_image`. Computed by the
+        database, so the image itself need not be loaded.
+    :type has_preview: bool
+
     :param created_at: When this Post was created.
     :type created_at: datetime
 
@@ -160,13 +236,29 @@ class Post(db.Model):
     link = db.Column(db.String(500))
     preview_image = db.Column(db.Text)
     binary_content = db.Column(db.Text)
+    has_media = db.Column(db.Boolean, nullable=False, default=False)
+    has_preview = db.column_property(preview_image.isnot(None))
 
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now())
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
     published_at = db.Column(db.DateTime)
 
     likes = db.Column(db.Integer, nullable=False, default=0)
     dislikes = db.Column(db.Integer, nullable=False, default=0)
 
+    # match the ORDER BY of the listings (newest first, ties by ID), so a page is an
+    # index range scan rather than a sort of the whole table
+    __table_args__ = (
+        db.Index("ix_post_published_at_id", published_at.desc(), id),
+        db.Index("ix_post_created_at_id", created_at.desc(), id),
+        db.Index(
+            "ix_post_media_published_at_id",
+            published_at.desc(),
+            id,
+            postgresql_where=has_media.is_(True),
+            sqlite_where=has_media.is_(True),
+        ),
+    )
+
     publisher = db.relationship(
         "Publisher", foreign_keys="Post.publisher_id", backref="posts"
     )
@@ -177,6 +269,11 @@ class Post(db.Model):
         single_parent=True,
     )
 
+    @validates("binary_content")
+    def _set_has_media(self, key, binary_content):
+        self.has_media = binary_content is not None
+        return binary_content
+
 
 class Interest(db.Model):
     """
@@ -196,7 +293,7 @@ class Interest(db.Model):
     __tablename__ = "interest"
 
     id = db.Column(db.Integer, autoincrement=True, primary_key=True)
-    name = db.Column(db.String(100), unique=True, nullable=False)
+    name = db.Column(db.String(100), unique=True, index=True, nullable=False)
     description = db.Column(db.String(200), nullable=False, default="")
 
     posts = db.relationship(
@@ -204,14 +301,10 @@ class Interest(db.Model):
         secondary="post_interest",
         primaryjoin=(post_interest.c.interest_id == id),
         secondaryjoin=(post_interest.c.post_id == Post.id),
-        backref=db.backref("interests", lazy="dynamic"),
+        backref=db.backref("interests", lazy="selectin"),
         lazy="dynamic",
     )
 
 
-class PostModification(db.Model):
-    """
-    Stores the edit history of a :class:`Post`. TODO
-    """
-
-    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+# The edit history of a Post (PostModification) is not declared as a model until it has
+# columns, so that no empty table is created.
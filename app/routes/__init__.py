@@ -7,6 +7,7 @@ api = Blueprint("api", __name__)
 def after_request(response):
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Access-Control-Allow-Headers"] = "Authorization,Content-Type"
+    response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor"
     return response
 
 
@@ -1,11 +1,20 @@
+import hmac
+import time
+from functools import lru_cache
+
 from flask import abort, current_app, g, jsonify
 from flask_httpauth import HTTPBasicAuth
 
+from .. import db
 from ..models import Publisher
 from . import api
 
 auth = HTTPBasicAuth()
 
+TOKEN_EXPIRATION = 43200
+# tokens are signed at most once per interval per publisher, and reused within it
+TOKEN_REISSUE_INTERVAL = 3600
+
 """
 Authentication scheme provided by Flask-HTTPAuth
 
@@ -16,13 +25,33 @@ Uses standard Authentication header, with "Basic TOKEN", where TOKEN is the base
 
 @auth.verify_password
 def verify_password(email_or_token, password):
+    # checked first, so the admin override never touches the database or a password hash
+    admin_override = current_app.config["ADMIN_OVERRIDE"]
+    if (
+        password == ""
+        and admin_override
+        and hmac.compare_digest(email_or_token.encode(), admin_override.encode())
+    ):
+        return Publisher(name="admin", email="", full_admin=True)
+
+    # the same credentials may be verified several times within a request
+    key = (email_or_token, password)
+    if g.get("_auth_cache_key") == key:
+        return g._auth_cache_user
+
+    user = _authenticate(email_or_token, password)
+
+    g._auth_cache_key = key
+    g._auth_cache_user = user
+
+    return user
+
+
+def _authenticate(email_or_token, password):
     if email_or_token == "":
         return False
 
     if password == "":
-        if email_or_token == current_app.config["ADMIN_OVERRIDE"]:
-            return Publisher(name="admin", email="", full_admin=True)
-
         g.current_user = Publisher.verify_auth_token(email_or_token)
         g.token_used = True
         if g.current_user is not None:
@@ -30,7 +59,9 @@ def verify_password(email_or_token, password):
         else:
             return None
 
-    publisher = Publisher.query.filter_by(email=email_or_token.lower()).first()
+    publisher = Publisher.query.filter_by(
+        email=Publisher.normalize_email(email_or_token)
+    ).first()
     if not publisher:
         return None
 
@@ -38,15 +69,41 @@ def verify_password(email_or_token, password):
     g.token_used = False
 
     if publisher.check_password(password):
+        # persist the hash if it was migrated during the check
+        if db.session.is_modified(publisher):
+            db.session.commit()
+
         return g.current_user
     else:
         return None
 
 
+@lru_cache(maxsize=10_000)
+def _signed_token(publisher_id, interval, secret_key):
+    """Token for a publisher, expiring :data:`TOKEN_EXPIRATION` seconds after the start of
+    the reissue interval. The secret key is only part of the cache key, so rotating it
+    invalidates cached tokens."""
+    return Publisher.encode_auth_token(
+        publisher_id, interval * TOKEN_REISSUE_INTERVAL + TOKEN_EXPIRATION
+    )
+
+
 @api.route("/tokens/", methods=["POST"])
+@auth.login_required
 def get_token():
-    if g.current_user.is_anonymous or g.token_used:
+    # tokens can only be requested with an email and password
+    if g.get("token_used", True):
         abort(403)
+
+    now = time.time()
+    interval = int(now) // TOKEN_REISSUE_INTERVAL
+    expires = interval * TOKEN_REISSUE_INTERVAL + TOKEN_EXPIRATION
+
     return jsonify(
-        {"token": g.current_user.generate_auth_token(43200), "expiration": 43200}
+        {
+            "token": _signed_token(
+                g.current_user.id, interval, current_app.config["SECRET_KEY"]
+            ),
+            "expiration": int(expires - now),
+        }
     )
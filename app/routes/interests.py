@@ -1,9 +1,37 @@
-from flask import abort, jsonify, request
+import time
+from hashlib import blake2b
+
+import orjson
+from flask import abort, current_app, request
 
 from .. import db
+from ..decorators import invalidate
 from ..models import Interest
 from . import api
 from .authentication import auth
+from .posts import LISTING_CACHE_VERSION
+
+# seconds clients (and other processes' caches) may hold a stale list of interests for
+INTERESTS_MAX_AGE = 60
+
+
+def _interests_cache():
+    """Cached response for :func:`get_interests`, stored on the current app. The version
+    is bumped whenever an interest is changed by this process."""
+    return current_app.extensions.setdefault(
+        "interests_cache",
+        {
+            "version": 0,
+            "built_version": None,
+            "etag": None,
+            "body": None,
+            "built_at": 0,
+        },
+    )
+
+
+def _invalidate_interests():
+    _interests_cache()["version"] += 1
 
 
 @api.route("/interests/", methods=["GET"])
@@ -17,11 +45,33 @@ def get_interests():
 
     :return: Array of interest names + descriptions
     """
-    return jsonify(
-        [
-            {"name": interest.name, "description": interest.description}
-            for interest in Interest.query.all()
-        ]
+    cache = _interests_cache()
+    stale = time.time() - cache["built_at"] > INTERESTS_MAX_AGE
+
+    # rebuild when changed here, or periodically to pick up changes made by other processes
+    if cache["built_version"] != cache["version"] or stale:
+        rows = db.session.execute(db.select(Interest.name, Interest.description)).all()
+
+        cache["body"] = orjson.dumps(
+            [{"name": name, "description": description} for name, description in rows]
+        )
+        # derived from the body, so a rebuild picking up other changes gets a new ETag
+        cache["etag"] = blake2b(cache["body"], digest_size=16).hexdigest()
+        cache["built_version"] = cache["version"]
+        cache["built_at"] = time.time()
+
+    etag = cache["etag"]
+
+    headers = {
+        "ETag": 'W/"{}"'.format(etag),
+        "Cache-Control": "public, max-age={}".format(INTERESTS_MAX_AGE),
+    }
+
+    if request.if_none_match.contains_weak(etag):
+        return "", 304, headers
+
+    return current_app.response_class(
+        cache["body"], mimetype="application/json", headers=headers
     )
 
 
@@ -53,8 +103,9 @@ def create_interests():
 
     db.session.add(interest)
     db.session.commit()
+    _invalidate_interests()
 
-    return 201, ""
+    return "", 201
 
 
 @api.route("/interests/<name>/", methods=["PATCH"])
@@ -81,8 +132,9 @@ def update_interests(name: str):
     interest.description = description
 
     db.session.commit()
+    _invalidate_interests()
 
-    return 201, ""
+    return "", 201
 
 
 @api.route("/interests/<name>/", methods=["DELETE"])
@@ -97,7 +149,10 @@ def delete_interests(name: str):
 
     :return: 201
     """
-    Interest.query.filter(Interest.name == name).delete(synchronize_session="fetch")
+    Interest.query.filter(Interest.name == name).delete(synchronize_session=False)
     db.session.commit()
+    _invalidate_interests()
+    # post listings include interest names
+    invalidate(LISTING_CACHE_VERSION)
 
-    return 201, ""
+    return "", 201
@@ -1,24 +1,228 @@
+import binascii
+from base64 import b64decode
 from datetime import datetime
 
-from flask import abort, jsonify, request
+from flask import abort, current_app, jsonify, request, url_for
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload, lazyload, load_only, selectinload
 
 from .. import db
-from ..models import Interest, Post
+from ..decorators import cached_response, invalidate
+from ..models import Interest, Post, Publisher, post_interest
 from . import api
 from .authentication import auth
 
+PAGE_SIZE = 15
+# deep offsets make the database scan and discard every previous row, use cursors instead
+MAX_PAGE = 1000
+
+# listings are cached briefly, and invalidated whenever a post changes
+LISTING_CACHE_TIMEOUT = 30
+LISTING_CACHE_VERSION = "posts"
+
+# rows per multi-row INSERT, well below the bind parameter limits of databases
+BULK_INSERT_BATCH = 1000
+
+
+def _paginate_keyset(query, column, cursor, limit=PAGE_SIZE):
+    """
+    Get a page of ``query`` ordered by ``column`` descending, with ties ordered by ID.
+    Unlike offset pagination, this needs no count query and does not scan the rows of
+    previous pages.
+
+    :param cursor: Cursor of the page to get, or None for the first page.
+    :raises ValueError: If the cursor is invalid.
+    :return: The items of the page, and the cursor of the next page (None if there is no
+        next page).
+    """
+    query = query.order_by(column.desc(), Post.id)
+
+    if cursor is not None:
+        value, _, last_id = cursor.rpartition(",")
+        value, last_id = datetime.fromisoformat(value), int(last_id)
+
+        query = query.filter(
+            or_(column < value, and_(column == value, Post.id > last_id))
+        )
+
+    items = query.limit(limit + 1).all()
+
+    if len(items) > limit:
+        return items[:limit], _cursor(items[limit - 1], column)
+    else:
+        return items, None
+
+
+def _cursor(post, column):
+    return "{},{}".format(getattr(post, column.key).isoformat(), post.id)
+
+
+def _get_page(query, column):
+    """
+    Get the page of ``query`` requested by the ``page`` or ``after`` arguments. Numbered
+    pages are still supported, but cursors are preferred.
+
+    :raises ValueError: If the page or cursor is invalid, or the page is past
+        :data:`MAX_PAGE`.
+    :return: The items of the page, and the cursor of the next page.
+    """
+    if page := request.args.get("page"):
+        page = int(page)
+
+        if page > MAX_PAGE:
+            raise ValueError("page {} is past the maximum of {}".format(page, MAX_PAGE))
+
+        posts = query.order_by(column.desc(), Post.id).paginate(page, PAGE_SIZE)
+        next_cursor = _cursor(posts.items[-1], column) if posts.has_next else None
+
+        return posts.items, next_cursor
+    else:
+        return _paginate_keyset(query, column, request.args.get("after"))
+
+
+def _get_interests(names):
+    """Get the :class:`Interest` of each name that exists, in one query"""
+    if not names:
+        return []
+
+    by_name = {
+        interest.name: interest
+        for interest in Interest.query.filter(Interest.name.in_(names))
+    }
+
+    return [by_name[name] for name in names if name in by_name]
+
+
+def _interest_names(names):
+    """Interest names given by a request, aborts with 400 unless they are a list of
+    strings"""
+    if names is None:
+        return []
+
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        abort(400)
+
+    return names
+
+
+def _published_at(publish_at):
+    """When to publish a post given as a UNIX timestamp, aborts with 400 if it is not
+    one"""
+    if publish_at is None:
+        return None
+
+    # bool is an int too, but never a timestamp
+    if not isinstance(publish_at, (int, float)) or isinstance(publish_at, bool):
+        abort(400)
+
+    try:
+        return datetime.fromtimestamp(publish_at)
+    except (OverflowError, OSError, ValueError):
+        abort(400)
+
+
+def _post_values(data):
+    """
+    Column values of a new :class:`Post` from request ``data``, see :func:`create_posts`.
+    Aborts with 400 if required values are missing.
+    """
+    title = data.get("title")
+
+    if title is None:
+        abort(400)
+
+    short_content = data.get("short_content")
+    content = data.get("content")
+    link = data.get("link")
+    preview_image = data.get("preview_image")
+    binary_content = data.get("binary_content")
+
+    if (content or link) is None:
+        abort(400)
+
+    published_at = _published_at(data.get("publish_at"))
+
+    return {
+        "title": title,
+        "short_content": short_content,
+        "content": content,
+        "link": link,
+        "published_at": published_at,
+        "preview_image": preview_image,
+        "binary_content": binary_content,
+    }
+
+
+def _insert_posts(rows):
+    """
+    Insert ``rows`` of :class:`Post` column values with as few statements as the database
+    allows, skipping the ORM.
+
+    On databases with RETURNING (PostgreSQL) each batch is one multi-row INSERT. On
+    SQLite all rows are one executemany, and since the transaction holds the write lock
+    from the first row, the new rows have the highest IDs. Other databases insert one row
+    at a time to fetch the IDs.
+
+    :return: IDs of the new posts, in the order of ``rows``.
+    """
+    table = Post.__table__
+    dialect = db.engine.dialect
+
+    if dialect.full_returning:
+        ids = []
+
+        for start in range(0, len(rows), BULK_INSERT_BATCH):
+            batch = rows[start : start + BULK_INSERT_BATCH]
+            statement = table.insert().values(batch).returning(table.c.id)
+            # IDs come from a sequence, so ascend in the order of the VALUES
+            ids += sorted(db.session.execute(statement).scalars())
+
+        return ids
+
+    if dialect.name == "sqlite":
+        db.session.execute(table.insert(), rows)
+
+        ids = db.session.execute(
+            db.select(table.c.id).order_by(table.c.id.desc()).limit(len(rows))
+        ).scalars()
+
+        return list(reversed(ids.all()))
+
+    db.session.bulk_insert_mappings(Post, rows, return_defaults=True)
+
+    return [row["id"] for row in rows]
+
+
+def _preview_url(post):
+    return url_for("api.get_post_preview", id=post.id) if post.has_preview else None
+
+
+def _page_response(items, next_cursor):
+    response = jsonify(items)
+
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return response
+
 
 @api.route("/posts/all/", methods=["GET"])
 @auth.login_required
+@cached_response(LISTING_CACHE_TIMEOUT, LISTING_CACHE_VERSION)
 def all_posts():
     """
     Get a page of posts ordered by creation date. Requires authorization.
 
-    **Route**: /api/v1/posts/all/?page=page
+    **Route**: /api/v1/posts/all/?after=cursor
 
     **Method**: GET
 
-    :param page: Optionally specify the page to get. Otherwise returns the first page.
+    :param after: Optionally specify the cursor of the page to get, as given by the
+        ``X-Next-Cursor`` header of the previous page. Otherwise returns the first page.
+        The header is absent on the last page.
+    :type after: str
+
+    :param page: Alternatively, specify the page number to get.
     :type page: int
 
     :return: A list of previews of posts.
@@ -30,45 +234,62 @@ def all_posts():
                 "title": "title",
                 "short_content": "short_content",
                 "published_at": "time",
-                "preview": "preview base64",
+                "preview": "preview url",
                 "interests": []
             }
     """
+    query = Post.query.options(
+        load_only(
+            Post.id,
+            Post.title,
+            Post.short_content,
+            Post.created_at,
+            Post.published_at,
+            Post.has_preview,
+        ),
+        selectinload(Post.interests),
+    )
+
     try:
-        page = int(request.args.get("page") or 1)
+        posts, next_cursor = _get_page(query, Post.created_at)
     except ValueError:
         abort(400)
-    else:
-        posts = Post.query.order_by(Post.created_at.desc()).paginate(page, 15)
-
-        return jsonify(
-            [
-                {
-                    "id": post.id,
-                    "title": post.title,
-                    "short_content": post.short_content,
-                    "created_at": post.created_at.timestamp(),
-                    "published_at": published_at.timestamp()
-                    if (published_at := post.published_at) is not None
-                    else None,
-                    "preview": post.preview_image,
-                    "interests": [interest.name for interest in post.interests],
-                }
-                for post in posts.items
-            ]
-        )
+
+    return _page_response(
+        [
+            {
+                "id": post.id,
+                "title": post.title,
+                "short_content": post.short_content,
+                "created_at": post.created_at.timestamp(),
+                "published_at": published_at.timestamp()
+                if (published_at := post.published_at) is not None
+                else None,
+                "preview": _preview_url(post),
+                "interests": [interest.name for interest in post.interests],
+            }
+            for post in posts
+        ],
+        next_cursor,
+    )
 
 
 @api.route("/posts/media/", methods=["GET"])
+@cached_response(LISTING_CACHE_TIMEOUT, LISTING_CACHE_VERSION)
 def media_posts():
     """
     Get a page of recent media posts.
 
-    **Route**: /api/v1/posts/media/?page=page
+    **Route**: /api/v1/posts/media/?after=cursor
 
     **Method**: GET
 
-    :param page: Optionally specify the page to get. Otherwise returns the first page.
+    :param after: Optionally specify the cursor of the page to get, as given by the
+        ``X-Next-Cursor`` header of the previous page. Otherwise returns the first page.
+        The header is absent on the last page.
+    :type after: str
+
+    :param page: Alternatively, specify the page number to get.
     :type page: int
 
     :return: A list of previews of posts.
@@ -79,46 +300,57 @@ def media_posts():
                 "id": 1,
                 "title": "title",
                 "published_at": "time",
-                "preview": "preview base64",
+                "preview": "preview url",
                 "interests": []
             }
     """
+    now = datetime.now()
+
+    query = (
+        Post.query.options(
+            load_only(Post.id, Post.title, Post.published_at, Post.has_preview),
+            selectinload(Post.interests),
+        )
+        .filter(Post.published_at <= now)
+        .filter(Post.has_media.is_(True))
+    )
+
     try:
-        page = int(request.args.get("page") or 1)
+        posts, next_cursor = _get_page(query, Post.published_at)
     except ValueError:
         abort(400)
-    else:
-        posts = (
-            Post.query.order_by(Post.published_at.desc())
-            .filter(Post.published_at <= datetime.now())
-            .filter(Post.binary_content.isnot(None))
-            .paginate(page, 15)
-        )
 
-        return jsonify(
-            [
-                {
-                    "id": post.id,
-                    "title": post.title,
-                    "published_at": post.published_at.timestamp(),
-                    "preview": post.preview_image,
-                    "interests": [interest.name for interest in post.interests],
-                }
-                for post in posts.items
-            ]
-        )
+    return _page_response(
+        [
+            {
+                "id": post.id,
+                "title": post.title,
+                "published_at": post.published_at.timestamp(),
+                "preview": _preview_url(post),
+                "interests": [interest.name for interest in post.interests],
+            }
+            for post in posts
+        ],
+        next_cursor,
+    )
 
 
 @api.route("/posts/recent/", methods=["GET"])
+@cached_response(LISTING_CACHE_TIMEOUT, LISTING_CACHE_VERSION)
 def recent_posts():
     """
     Get a page of recent posts.
 
-    **Route**: /api/v1/posts/recent/?page=page
+    **Route**: /api/v1/posts/recent/?after=cursor
 
     **Method**: GET
 
-    :param page: Optionally specify the page to get. Otherwise returns the first page.
+    :param after: Optionally specify the cursor of the page to get, as given by the
+        ``X-Next-Cursor`` header of the previous page. Otherwise returns the first page.
+        The header is absent on the last page.
+    :type after: str
+
+    :param page: Alternatively, specify the page number to get.
     :type page: int
 
     :param interests: Optionally specify a list of interest names to filter to,
@@ -134,45 +366,50 @@ def recent_posts():
                 "title": "title",
                 "short_content": "short_content",
                 "published_at": "time",
-                "preview": "preview base64",
+                "preview": "preview url",
                 "interests": []
             }
     """
+    now = datetime.now()
+
+    query = Post.query.options(
+        load_only(
+            Post.id,
+            Post.title,
+            Post.short_content,
+            Post.published_at,
+            Post.has_preview,
+        ),
+        selectinload(Post.interests),
+    ).filter(Post.published_at <= now)
+
+    if (interests := request.args.get("interests")) is not None:
+        interests = interests.split(" ")
+
+        # join rather than .any(), which is a correlated EXISTS evaluated per row
+        query = (
+            query.join(Post.interests).filter(Interest.name.in_(interests)).distinct()
+        )
+
     try:
-        page = int(request.args.get("page") or 1)
+        posts, next_cursor = _get_page(query, Post.published_at)
     except ValueError:
         abort(400)
-    else:
-        if (interests := request.args.get("interests")) is not None:
-            interests = interests.split(" ")
-
-            # please man please just let me write SQL
-            posts = (
-                Post.query.order_by(Post.published_at.desc())
-                .filter(Post.published_at <= datetime.now())
-                .filter(Post.interests.any(Interest.name.in_(interests)))
-                .paginate(page, 15)
-            )
-        else:
-            posts = (
-                Post.query.order_by(Post.published_at.desc())
-                .filter(Post.published_at <= datetime.now())
-                .paginate(page, 15)
-            )
 
-        return jsonify(
-            [
-                {
-                    "id": post.id,
-                    "title": post.title,
-                    "short_content": post.short_content,
-                    "published_at": post.published_at.timestamp(),
-                    "preview": post.preview_image,
-                    "interests": [interest.name for interest in post.interests],
-                }
-                for post in posts.items
-            ]
-        )
+    return _page_response(
+        [
+            {
+                "id": post.id,
+                "title": post.title,
+                "short_content": post.short_content,
+                "published_at": post.published_at.timestamp(),
+                "preview": _preview_url(post),
+                "interests": [interest.name for interest in post.interests],
+            }
+            for post in posts
+        ],
+        next_cursor,
+    )
 
 
 @api.route("/posts/<int:id>/", methods=["GET"])
@@ -188,36 +425,130 @@ def get_posts(id: int):
     :param id: The ID of the :class:`Post` to get.
     :type id: int
 
+    :param fields: Pass ``meta`` to leave out the content and media of the post.
+    :type fields: str
+
     :return: :class:`Post`
     """
     if id is None:
         abort(400)
 
-    post = Post.query.get(id)
+    now = datetime.now()
+    meta = request.args.get("fields") == "meta"
 
-    if post is not None:
-        if post.published_at is None or post.published_at > datetime.now():
-            abort(404)
+    options = [
+        joinedload(Post.publisher).load_only(Publisher.name),
+        selectinload(Post.interests),
+    ]
+    if meta:
+        options.append(
+            load_only(
+                Post.title,
+                Post.short_content,
+                Post.link,
+                Post.published_at,
+                Post.followup_id,
+            )
+        )
 
-        else:
-            json_data = {
-                "title": post.title,
-                "short_content": post.short_content,
-                "content": post.content,
-                "link": post.link,
-                "published_at": post.published_at.timestamp(),
-                "publisher": {
-                    "name": post.publisher.name if post.publisher is not None else None
-                },
-                "media": post.binary_content,
-                "followup": post.followup_id,
-                "interests": [interest.name for interest in post.interests],
-            }
+    post = (
+        Post.query.options(*options)
+        .filter(Post.id == id, Post.published_at <= now)
+        .first()
+    )
 
-            return jsonify(json_data)
-    else:
+    if post is None:
+        abort(404)
+
+    json_data = {
+        "title": post.title,
+        "short_content": post.short_content,
+        "link": post.link,
+        "published_at": post.published_at.timestamp(),
+        "publisher": {
+            "name": post.publisher.name if post.publisher is not None else None
+        },
+        "followup": post.followup_id,
+        "interests": [interest.name for interest in post.interests],
+    }
+
+    if not meta:
+        json_data["content"] = post.content
+        json_data["media"] = post.binary_content
+
+    return jsonify(json_data)
+
+
+# magic numbers of image formats, used when the preview is not a data URL
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),
+)
+
+# the only types a preview is served as, anything else could be rendered as a page
+IMAGE_TYPES = frozenset(image_type for _, image_type in IMAGE_SIGNATURES)
+
+
+@api.route("/posts/<int:id>/preview/", methods=["GET"])
+@auth.login_required(optional=True)
+def get_post_preview(id: int):
+    """
+    Get the preview image of a :class:`Post`, as linked by the ``preview`` of post
+        listings. Previews of unpublished posts require authorization.
+
+    **Route**: /api/v1/posts/ID/preview/
+
+    **Method**: GET
+
+    :param id: The ID of the :class:`Post` to get the preview of.
+    :type id: int
+
+    :return: The decoded preview image.
+    """
+    post = Post.query.options(
+        load_only(Post.published_at, Post.preview_image), lazyload(Post.interests)
+    ).get(id)
+
+    if post is None or post.preview_image is None:
+        abort(404)
+
+    published = post.published_at is not None and post.published_at <= datetime.now()
+
+    if not published and not auth.current_user():
+        abort(404)
+
+    mimetype = "application/octet-stream"
+    preview = post.preview_image
+
+    # previews may be sent as data URLs, e.g. "data:image/png;base64,..."
+    if preview.startswith("data:"):
+        header, _, preview = preview.partition(",")
+        data_type = header[5:].split(";")[0]
+
+        if data_type in IMAGE_TYPES:
+            mimetype = data_type
+
+    try:
+        image = b64decode(preview)
+    except binascii.Error:
         abort(404)
 
+    for signature, image_type in IMAGE_SIGNATURES:
+        if image.startswith(signature):
+            mimetype = image_type
+            break
+
+    response = current_app.response_class(image, mimetype=mimetype)
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    response.cache_control.max_age = 300
+    response.cache_control.public = published
+    response.cache_control.private = not published
+    response.add_etag()
+
+    return response.make_conditional(request)
+
 
 @api.route("/posts/", methods=["POST"])
 @auth.login_required
@@ -259,49 +590,86 @@ def create_posts():
     if request.json is None:
         abort(400)
 
-    title = request.json.get("title")
+    values = _post_values(request.json)
 
-    if title is None:
+    names = _interest_names(request.json.get("interests"))
+    interests = _get_interests(names)
+
+    if len(interests) != len(names):
         abort(400)
 
-    short_content = request.json.get("short_content")
-    content = request.json.get("content")
-    link = request.json.get("link")
-    preview_image = request.json.get("preview_image")
-    binary_content = request.json.get("binary_content")
+    # by ID, so the unsaved publisher of the admin override is not saved along with it
+    post = Post(**values, interests=interests, publisher_id=auth.current_user().id)
 
-    if (content or link) is None:
+    db.session.add(post)
+    db.session.commit()
+    invalidate(LISTING_CACHE_VERSION)
+
+    return jsonify({"id": post.id})
+
+
+@api.route("/posts/bulk/", methods=["POST"])
+@auth.login_required
+def create_posts_bulk():
+    """
+    Create many :class:`Post` at once, for imports. Requires authorization
+
+    **Route**: /api/v1/posts/bulk/
+
+    **Method**: POST
+
+    Takes a list of posts, each with the same parameters as :func:`create_posts`. If any
+        post is invalid or names an interest that does not exist, none are created.
+
+    :return: IDs of the new posts, in the order given
+
+    .. code-block:: json
+
+            {
+                "ids": [1, 2]
+            }
+    """
+    if not isinstance(request.json, list) or not request.json:
         abort(400)
 
-    if request.json.get("publish_at") is not None:
-        published_at = datetime.fromtimestamp(request.json.get("publish_at"))
-    else:
-        published_at = None
+    if not all(isinstance(data, dict) for data in request.json):
+        abort(400)
 
-    interests = [
-        Interest.query.filter(Interest.name == interest).first()
-        for interest in (request.json.get("interests") or [])
-    ]
+    publisher_id = auth.current_user().id
+    rows = []
+
+    for data in request.json:
+        values = _post_values(data)
+        values["publisher_id"] = publisher_id
+        # bulk inserts skip validators, so keep has_media in sync here
+        values["has_media"] = values["binary_content"] is not None
+        rows.append(values)
 
-    if any(interest is None for interest in interests):
+    # interest names of each post, resolved together in one query
+    names = [set(_interest_names(data.get("interests"))) for data in request.json]
+    all_names = set().union(*names)
+    by_name = {
+        interest.name: interest.id for interest in _get_interests(list(all_names))
+    }
+
+    if len(by_name) != len(all_names):
         abort(400)
 
-    post = Post(
-        title=title,
-        short_content=short_content,
-        content=content,
-        link=link,
-        published_at=published_at,
-        preview_image=preview_image,
-        binary_content=binary_content,
-        interests=interests,
-        publisher=auth.current_user(),
-    )
+    ids = _insert_posts(rows)
+
+    links = [
+        {"post_id": post_id, "interest_id": by_name[name]}
+        for post_id, post_names in zip(ids, names)
+        for name in post_names
+    ]
+
+    if links:
+        db.session.execute(post_interest.insert(), links)
 
-    db.session.add(post)
     db.session.commit()
+    invalidate(LISTING_CACHE_VERSION)
 
-    return jsonify({"id": post.id})
+    return jsonify({"ids": ids})
 
 
 @api.route("/posts/<int:id>/", methods=["PATCH"])
@@ -337,7 +705,8 @@ def update_posts(id: int):
     if request.json is None:
         abort(400)
 
-    post = Post.query.get(id)
+    # interests are only loaded when they are replaced
+    post = Post.query.options(lazyload(Post.interests)).get(id)
 
     if post is None:
         abort(404)
@@ -357,13 +726,10 @@ def update_posts(id: int):
         if (binary_content := request.json.get("binary_content")) is not None:
             post.binary_content = binary_content
 
-        if (interests := request.json.get("interests")) is not None:
-            interests = [
-                Interest.query.filter(Interest.name == interest).first()
-                for interest in interests
-            ]
+        if (names := request.json.get("interests")) is not None:
+            interests = _get_interests(_interest_names(names))
 
-            if any(interest is None for interest in interests):
+            if len(interests) != len(names):
                 # rollback db to prevent odd changes sticking around in memory
                 db.session.rollback()
 
@@ -372,6 +738,7 @@ def update_posts(id: int):
                 post.interests = interests
 
         db.session.commit()
+        invalidate(LISTING_CACHE_VERSION)
 
         return "", 201
 
@@ -423,10 +790,7 @@ def create_followup_posts(id: int):
     if (content or link) is None:
         abort(400)
 
-    if request.json.get("publish_at") is not None:
-        published_at = datetime.fromtimestamp(request.json.get("publish_at"))
-    else:
-        published_at = None
+    published_at = _published_at(request.json.get("publish_at"))
 
     post = Post(
         title=title,
@@ -435,10 +799,10 @@ def create_followup_posts(id: int):
         published_at=published_at,
         preview_image=preview_image,
         binary_content=binary_content,
-        publisher=auth.current_user(),
+        publisher_id=auth.current_user().id,
     )
 
-    previous_post = Post.query.get(id)
+    previous_post = Post.query.options(lazyload(Post.interests)).get(id)
     if previous_post is None:
         abort(404)
     else:
@@ -448,5 +812,6 @@ def create_followup_posts(id: int):
 
         previous_post.followup = post
         db.session.commit()
+        invalidate(LISTING_CACHE_VERSION)
 
         return jsonify({"id": post.id})
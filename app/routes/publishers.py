@@ -1,15 +1,26 @@
-import re
-import string
-from secrets import randbelow
+from secrets import token_urlsafe
 
 from flask import abort, jsonify, request
+from sqlalchemy.exc import IntegrityError
 
 from .. import db
 from ..models import Publisher
 from . import api
 from .authentication import auth
 
-PASSWORD_CHARACTERS = string.digits + string.ascii_letters + string.punctuation
+
+def _valid_email(email):
+    """
+    Loose check that ``email`` is a local part and a dotted domain without whitespace.
+    Only linear scans are used, so adversarial input cannot make it backtrack.
+    """
+    local, _, domain = email.rpartition("@")
+
+    # the domain needs a dot with at least one character either side of it
+    if not local or "." not in domain[1:-1]:
+        return False
+
+    return not any(c.isspace() for c in email)
 
 
 @api.route("/publisher/", methods=["PUT"])
@@ -40,40 +51,49 @@ def create_publisher():
             }
 
     """
+    # checked before the body is parsed, so forbidden requests never parse it
     if not auth.current_user().full_admin:
         abort(403)
 
-    name = request.json.get("name")
-    email = request.json.get("email")
+    if not request.is_json:
+        abort(400)
+
+    data = request.get_json()
 
-    # check if any parameters are not provided
-    if name and email is None:
+    if not isinstance(data, dict):
         abort(400)
 
-    # check if the email is invalid
-    if not re.match(r"\S+@\S+\.\S+", email):
+    name = data.get("name")
+    email = data.get("email")
+
+    # check if any parameters are not provided, or are not strings
+    if not isinstance(name, str) or not isinstance(email, str):
         abort(400)
 
-    # if a publisher already exists with this email, abort
-    existing = Publisher.query.filter(Publisher.email == email).first()
+    # check if the email is invalid
+    if not _valid_email(email):
+        abort(400)
 
-    if existing is not None:
-        abort(409)
+    # generate a random first-login password, that the user will be prompted to change
+    # secrets module is used for cryptographically secure generation, 12 random bytes
+    # encode to 16 URL-safe characters
+    password = token_urlsafe(12)
 
-    else:
-        # generate a random first-login password, that the user will be prompted to change
-        # secrets module is used for cryptographically secure generation
-        password = "".join(
-            PASSWORD_CHARACTERS[randbelow(len(PASSWORD_CHARACTERS))] for _ in range(16)
-        )
+    publisher = Publisher(name=name, email=email)
+    publisher.password = password
 
-        publisher = Publisher(name=name, email=email)
-        publisher.password = password
+    db.session.add(publisher)
 
-        db.session.add(publisher)
+    # if a publisher already exists with this email, the unique index rejects it
+    try:
         db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        abort(409)
 
-        return jsonify({"name": name, "email": email, "password": password})
+    return jsonify(
+        {"name": publisher.name, "email": publisher.email, "password": password}
+    )
 
 
 @api.route("/publisher/<int:id>/", methods=["GET"])
@@ -101,15 +121,15 @@ def get_publisher(id: int):
     if id is None:
         abort(400)
 
-    publisher = Publisher.query.get(id)
+    publisher = (
+        db.session.query(Publisher.name, Publisher.email).filter_by(id=id).first()
+    )
 
-    if publisher is not None:
-        json_data = {"name": publisher.name, "email": publisher.email}
-
-        return jsonify(json_data)
-    else:
+    if publisher is None:
         abort(404)
 
+    return jsonify({"name": publisher.name, "email": publisher.email})
+
 
 @api.route("/publisher/", methods=["PATCH"])
 @auth.login_required
@@ -122,19 +142,33 @@ def update_publisher():
     :param email: New email
     :type email: str
 
-    :return: 201
+    :return: 201, or 409 if another :class:`Publisher` has the email
     """
-    if request.json is None:
+    if not isinstance(request.json, dict):
+        abort(400)
+
+    password = request.json.get("password")
+    email = request.json.get("email")
+
+    if any(
+        value is not None and not isinstance(value, str) for value in (password, email)
+    ):
         abort(400)
 
     publisher = auth.current_user()
 
-    if (password := request.json.get("password")) is not None:
-        publisher.password = password
+    # verifying is cheaper than hashing again when the password is unchanged
+    if password is not None:
+        if not publisher.check_password(password):
+            publisher.password = password
 
-    if (email := request.json.get("email")) is not None:
+    if email is not None:
         publisher.email = email
 
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        abort(409)
 
     return "", 201
@@ -1,5 +1,7 @@
 import os
 
+from sqlalchemy.pool import StaticPool
+
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY")
@@ -9,16 +11,54 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Token granting full admin rights without a password or database lookup. Must be a
+    # long, high-entropy secret, since it bypasses password hashing entirely
     ADMIN_OVERRIDE = os.environ.get("ADMIN_OVERRIDE")
 
+    # response cache, e.g. CACHE_TYPE=RedisCache and CACHE_REDIS_URL to share the cache
+    # between processes
+    CACHE_TYPE = os.environ.get("CACHE_TYPE") or "SimpleCache"
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+
+    # Argon2 parameters are calibrated so that hashing takes about AUTH_TARGET_MS, unless
+    # given explicitly. Calibrated parameters are stored at ARGON2_PARAMS_PATH (defaults
+    # to the instance folder). Memory per hash is capped at ARGON2_MAX_MEMORY_COST KiB
+    # (46 MiB, as recommended by OWASP), the rest of the target goes to time cost
+    AUTH_TARGET_MS = int(os.environ.get("AUTH_TARGET_MS") or 350)
+    ARGON2_MAX_MEMORY_COST = int(os.environ.get("ARGON2_MAX_MEMORY_COST") or 46 * 1024)
+    ARGON2_PARAMS = None
+    ARGON2_PARAMS_PATH = os.environ.get("ARGON2_PARAMS_PATH")
+
     @staticmethod
     def init_app(app):
-        pass
+        # SQLite connections are not pooled in the same way, and reject these options
+        if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+            app.config.setdefault(
+                "SQLALCHEMY_ENGINE_OPTIONS",
+                {
+                    "pool_size": 20,
+                    "max_overflow": 40,
+                    "pool_pre_ping": True,
+                    "pool_recycle": 1800,
+                },
+            )
 
 
 class TestConfig(Config):
     SECRET_KEY = "test_secret_key"
     SQLALCHEMY_DATABASE_URI = "sqlite://"
+    # one in-memory database on a single connection, that stays alive between requests
+    # and can be used from the test client's threads
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": StaticPool,
+        "connect_args": {"check_same_thread": False},
+    }
+
+    CACHE_TYPE = "NullCache"
+
+    # the cheapest parameters Argon2 allows, the production parameters are still covered
+    # by tests hashing outside an app (see app.hashing.default_hasher)
+    ARGON2_PARAMS = {"time_cost": 1, "memory_cost": 8, "parallelism": 1}
 
 
 config = {"default": Config, "testing": TestConfig}
@@ -1,11 +1,139 @@
-import re
+import json
+import os
+import tempfile
 import time
 import unittest
 from base64 import b64encode
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from unittest import mock
 
-from app import create_app, db
+from flask import Flask
+from sqlalchemy import event
+
+from app import cache, create_app, db, hashing
 from app.models import Interest, Post, Publisher
+from app.routes.posts import LISTING_CACHE_VERSION
+
+# posts are dated relative to this, so the seed data needs no parsing
+_BASE_DATE = datetime(2022, 3, 2)
+
+# named posts of PostRouteTest, as (title, published_at)
+_SEED_POSTS = (
+    ("1", datetime(2022, 3, 5)),
+    ("2", datetime(2022, 3, 10)),
+    ("3", datetime(2022, 3, 3)),
+    ("4", datetime(2022, 3, 4)),
+    ("5", datetime(2022, 3, 7)),
+    ("6", _BASE_DATE),
+)
+
+# filler posts of PostRouteTest, older than the named posts
+_POST_ROWS = tuple(
+    {
+        "title": str(i),
+        "content": str(i),
+        "published_at": _BASE_DATE - timedelta(days=i),
+    }
+    for i in range(7, 35)
+)
+
+
+def _basic_auth(username, password=""):
+    """Basic authorization headers, with a token as ``username`` and no password by
+    default"""
+    credentials = b64encode(username.encode() + b":" + password.encode()).decode()
+
+    return {"Authorization": "Basic " + credentials}
+
+
+def _token_headers(publisher_id):
+    """
+    Basic authorization headers with a token of the publisher with ``publisher_id``.
+    Publishers are recreated with the same IDs by every setUp, so tokens are only signed
+    once per test class.
+    """
+    return _basic_auth(Publisher.encode_auth_token(publisher_id, time.time() + 3600))
+
+
+def _enable_savepoints(engine):
+    """pysqlite handles transactions itself and breaks SAVEPOINT, so let SQLAlchemy emit
+    BEGIN instead"""
+
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def do_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
+@contextmanager
+def _statements(engine):
+    """Collect the SQL statements executed on ``engine`` within the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Shares one app, test client, schema and the ``headers`` of publisher 1 between the
+    tests of a class. Each test runs in a transaction that is rolled back afterwards, with
+    the session in a SAVEPOINT so that routes can still commit and roll back.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app("testing")
+        cls.client = cls.app.test_client()
+
+        with cls.app.app_context():
+            _enable_savepoints(db.engine)
+            db.create_all()
+            # of the first publisher created by setUp
+            cls.headers = _token_headers(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.drop_all()
+
+    def setUp(self):
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        # the cached interest listing would outlive the rollback of each test
+        self.app.extensions.pop("interests_cache", None)
+
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.savepoint = self.connection.begin_nested()
+
+        self._session = db.session
+        db.session = db.create_scoped_session(
+            options={"bind": self.connection, "binds": {}}
+        )
+        event.listen(db.session(), "after_transaction_end", self._restart_savepoint)
+
+    def _restart_savepoint(self, session, transaction):
+        if not self.savepoint.is_active:
+            self.savepoint = self.connection.begin_nested()
+
+    def tearDown(self):
+        db.session.remove()
+        db.session = self._session
+
+        self.transaction.rollback()
+        self.connection.close()
+        self.app_context.pop()
 
 
 class PublisherTest(unittest.TestCase):
@@ -40,13 +168,91 @@ class PublisherTest(unittest.TestCase):
         self.assertFalse(self.publisher_2.check_password("lkasjdlkajsf"))
 
 
-class PublisherRouteTest(unittest.TestCase):
+def _fake_median_ms(hasher, runs=5):
+    """Hashing time model for :func:`app.hashing.calibrate`, 1 ms per MiB per pass"""
+    return hasher.time_cost * hasher.memory_cost / 1024
+
+
+class HashingTest(unittest.TestCase):
+    @mock.patch("app.hashing._median_ms", _fake_median_ms)
+    def test_calibrate(self):
+        self.assertEqual(
+            hashing.calibrate(350),
+            {"time_cost": 7, "memory_cost": 46 * 1024, "parallelism": 1},
+        )
+        self.assertEqual(
+            hashing.calibrate(350, max_memory_cost=16 * 1024),
+            {"time_cost": 10, "memory_cost": 16 * 1024, "parallelism": 1},
+        )
+        self.assertEqual(
+            hashing.calibrate(20),
+            {"time_cost": 1, "memory_cost": 16 * 1024, "parallelism": 1},
+        )
+
+    def test_init_app(self):
+        params = {"time_cost": 1, "memory_cost": 8, "parallelism": 1}
+
+        with tempfile.TemporaryDirectory() as directory:
+            app = Flask(__name__)
+            app.config.update(
+                ARGON2_PARAMS=None,
+                ARGON2_PARAMS_PATH=os.path.join(directory, "argon2", "params.json"),
+                ARGON2_MAX_MEMORY_COST=1024,
+                AUTH_TARGET_MS=100,
+            )
+
+            with mock.patch("app.hashing.calibrate", return_value=params) as calibrate:
+                hashing.init_app(app)
+                hashing.init_app(app)
+
+            # calibrated once, then read back from the written file
+            calibrate.assert_called_once_with(100, 1024)
+
+            with open(app.config["ARGON2_PARAMS_PATH"]) as f:
+                self.assertEqual(json.load(f), params)
+
+        self.assertEqual(app.extensions["ph"].time_cost, 1)
+        self.assertEqual(app.extensions["ph"].memory_cost, 8)
+
+    def test_init_app_unreadable(self):
+        params = {"time_cost": 1, "memory_cost": 8, "parallelism": 1}
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "argon2.json")
+            app = Flask(__name__)
+            app.config.update(
+                ARGON2_PARAMS=None,
+                ARGON2_PARAMS_PATH=path,
+                ARGON2_MAX_MEMORY_COST=1024,
+                AUTH_TARGET_MS=100,
+            )
+
+            # e.g. read while another worker was writing it
+            with open(path, "w") as f:
+                f.write('{"time_cost": ')
+
+            with mock.patch("app.hashing.calibrate", return_value=params) as calibrate:
+                hashing.init_app(app)
+
+            calibrate.assert_called_once()
+
+            with open(path) as f:
+                self.assertEqual(json.load(f), params)
+
+            # written through a temporary file that is replaced into place
+            self.assertEqual(os.listdir(directory), ["argon2.json"])
+
+
+class PublisherRouteTest(DatabaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        with cls.app.app_context():
+            cls.headers_orr = _token_headers(2)
+
     def setUp(self):
-        self.app = create_app("testing")
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-        self.client = self.app.test_client()
+        super().setUp()
 
         self.publisher_1 = Publisher(
             name="Jude Southworth", email="judesouthworth@pm.me", full_admin=True
@@ -56,35 +262,9 @@ class PublisherRouteTest(unittest.TestCase):
             email="orr.bezalely@pm.me",
         )
 
-        db.session.add(self.publisher_1)
-        db.session.add(self.publisher_2)
+        db.session.add_all([self.publisher_1, self.publisher_2])
         db.session.commit()
 
-        self.headers = {
-            "Authorization": "Basic {}".format(
-                b64encode(
-                    "{}:".format(self.publisher_1.generate_auth_token(120)).encode(
-                        "utf-8"
-                    )
-                ).decode("utf-8")
-            )
-        }
-
-        self.headers_orr = {
-            "Authorization": "Basic {}".format(
-                b64encode(
-                    "{}:".format(self.publisher_2.generate_auth_token(120)).encode(
-                        "utf-8"
-                    )
-                ).decode("utf-8")
-            )
-        }
-
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
-
     def test_authorization(self):
         req1 = self.client.get("/api/v1/publisher/1/")
         req2 = self.client.put(
@@ -138,31 +318,29 @@ class PublisherRouteTest(unittest.TestCase):
         self.assertEqual(req1.status_code, 409)
 
     def test_create_publisher_400(self):
-        req1 = self.client.put(
-            "/api/v1/publisher/",
-            json={"name": "Jude", "email": "invalid"},
-            headers=self.headers,
-        )
-        req2 = self.client.put(
-            "/api/v1/publisher/",
-            json={"name": "Jude", "email": "invalid@also"},
-            headers=self.headers,
-        )
-        req3 = self.client.put(
-            "/api/v1/publisher/",
-            json={"name": "Jude", "email": "invalid.also"},
-            headers=self.headers,
-        )
-        req4 = self.client.put(
-            "/api/v1/publisher/",
-            json={"name": "Jude", "email": "invalid@also. "},
-            headers=self.headers,
+        for data in (
+            {"name": "Jude", "email": "invalid"},
+            {"name": "Jude", "email": "invalid@also"},
+            {"name": "Jude", "email": "invalid.also"},
+            {"name": "Jude", "email": "invalid@also. "},
+            {"email": "jude@example.com"},
+            {"name": "Jude", "email": "jude@example.com and more"},
+            {"name": "Jude", "email": 5},
+            {"name": ["Jude"], "email": "jude@example.com"},
+            [{"name": "Jude", "email": "jude@example.com"}],
+        ):
+            with self.subTest(data=data):
+                req = self.client.put(
+                    "/api/v1/publisher/", json=data, headers=self.headers
+                )
+
+                self.assertEqual(req.status_code, 400)
+
+        req = self.client.put(
+            "/api/v1/publisher/", data="name=Jude", headers=self.headers
         )
 
-        self.assertEqual(req1.status_code, 400)
-        self.assertEqual(req2.status_code, 400)
-        self.assertEqual(req3.status_code, 400)
-        self.assertEqual(req4.status_code, 400)
+        self.assertEqual(req.status_code, 400)
 
     def test_create_publisher(self):
         # put new publisher to API
@@ -175,7 +353,9 @@ class PublisherRouteTest(unittest.TestCase):
         self.assertEqual(req1.status_code, 200)
         self.assertEqual(req1.json["name"], "Taliesin Oldridge")
         self.assertEqual(req1.json["email"], "to@pm.me")
-        self.assertIsNotNone(re.match(r"^\S{16}$", req1.json["password"]))
+        password = req1.json["password"]
+        self.assertEqual(len(password), 16)
+        self.assertFalse(any(c.isspace() for c in password))
 
         # retrieve the publisher back from the API
         req2 = self.client.get(
@@ -208,60 +388,80 @@ class PublisherRouteTest(unittest.TestCase):
         self.assertEqual(req3.status_code, 201)
         self.assertNotEqual(self.publisher_1.password_hash, previous_hash)
 
+        previous_hash = self.publisher_1.password_hash
+        req4 = self.client.patch(
+            "/api/v1/publisher/", json={"password": "1234"}, headers=self.headers
+        )
 
-class PostRouteTest(unittest.TestCase):
+        self.assertEqual(req4.status_code, 201)
+        self.assertEqual(self.publisher_1.password_hash, previous_hash)
+
+    def test_update_publisher_400(self):
+        for data in ({"email": 5}, {"password": 1234}, ["js@pm.me"]):
+            with self.subTest(data=data):
+                req = self.client.patch(
+                    "/api/v1/publisher/", json=data, headers=self.headers
+                )
+
+                self.assertEqual(req.status_code, 400)
+
+        req5 = self.client.patch(
+            "/api/v1/publisher/",
+            json={"email": self.publisher_2.email},
+            headers=self.headers,
+        )
+
+        self.assertEqual(req5.status_code, 409)
+
+    def test_get_token(self):
+        self.publisher_1.password = "jude1234"
+        db.session.commit()
+
+        basic = _basic_auth("judesouthworth@pm.me", "jude1234")
+
+        req1 = self.client.post("/api/v1/tokens/", headers=basic)
+        req2 = self.client.post("/api/v1/tokens/", headers=self.headers)
+        req3 = self.client.post("/api/v1/tokens/")
+
+        self.assertEqual(req1.status_code, 200)
+        self.assertEqual(req2.status_code, 403)
+        self.assertEqual(req3.status_code, 401)
+        self.assertGreater(req1.json["expiration"], 3600)
+
+        token = _basic_auth(req1.json["token"])
+        req4 = self.client.get(
+            "/api/v1/publisher/{}/".format(self.publisher_1.id), headers=token
+        )
+
+        self.assertEqual(req4.status_code, 200)
+
+
+class PostRouteTest(DatabaseTestCase):
     def setUp(self):
-        self.app = create_app("testing")
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-        self.client = self.app.test_client()
+        super().setUp()
 
         self.publisher_1 = Publisher(
             name="Tyler Durden",
             email="narrator@pm.me",
         )
 
-        db.session.add(self.publisher_1)
-        db.session.flush()
-
         self.posts = [
             Post(
                 title=title,
                 content=title,
-                published_at=datetime.fromisoformat(date),
+                published_at=published_at,
                 publisher=self.publisher_1,
             )
-            for title, date in zip(
-                ["1", "2", "3", "4", "5", "6"],
-                [
-                    "2022-03-05",
-                    "2022-03-10",
-                    "2022-03-03",
-                    "2022-03-04",
-                    "2022-03-07",
-                    "2022-03-02",
-                ],
-            )
+            for title, published_at in _SEED_POSTS
         ]
 
-        [db.session.add(post) for post in self.posts]
-
-        for i in range(7, 35):
-            post = Post(
-                title=str(i),
-                content=str(i),
-                published_at=datetime.fromisoformat("2022-03-02") - timedelta(days=i),
-            )
-            db.session.add(post)
+        db.session.add_all([self.publisher_1] + self.posts)
+        # flush first, so the posts above get IDs 1-6
+        db.session.flush()
 
+        db.session.bulk_insert_mappings(Post, _POST_ROWS)
         db.session.commit()
 
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
-
     def test_recent_posts(self):
         req = self.client.get("/api/v1/posts/recent/")
 
@@ -280,10 +480,12 @@ class PostRouteTest(unittest.TestCase):
         req1 = self.client.get("/api/v1/posts/recent/?page=2")
         req2 = self.client.get("/api/v1/posts/recent/?page=3")
         req3 = self.client.get("/api/v1/posts/recent/?page=4")
+        req4 = self.client.get("/api/v1/posts/recent/?page=1001")
 
         self.assertEqual(req1.status_code, 200)
         self.assertEqual(req2.status_code, 200)
         self.assertEqual(req3.status_code, 404)
+        self.assertEqual(req4.status_code, 400)
 
         for i in range(0, 15):
             self.assertEqual(req1.json[i]["title"], str(i + 16))
@@ -291,6 +493,67 @@ class PostRouteTest(unittest.TestCase):
         for count, post in enumerate(req2.json, start=31):
             self.assertEqual(post["title"], str(count))
 
+    def test_posts_cursor(self):
+        titles = []
+        req = self.client.get("/api/v1/posts/recent/")
+
+        while "X-Next-Cursor" in req.headers:
+            self.assertEqual(req.status_code, 200)
+            self.assertEqual(len(req.json), 15)
+            titles += [post["title"] for post in req.json]
+
+            req = self.client.get(
+                "/api/v1/posts/recent/",
+                query_string={"after": req.headers["X-Next-Cursor"]},
+            )
+
+        titles += [post["title"] for post in req.json]
+
+        pages = [
+            self.client.get("/api/v1/posts/recent/?page={}".format(page)).json
+            for page in range(1, 4)
+        ]
+
+        self.assertEqual(titles, [post["title"] for page in pages for post in page])
+        self.assertEqual(len(titles), 34)
+
+        req = self.client.get("/api/v1/posts/recent/?after=invalid")
+
+        self.assertEqual(req.status_code, 400)
+
+    def test_all_posts_cursor(self):
+        # posts created within the same second must not repeat across pages
+        created_at = datetime(2022, 3, 2, 12)
+        db.session.bulk_insert_mappings(
+            Post,
+            [
+                {"title": str(i), "content": str(i), "created_at": created_at}
+                for i in range(35, 55)
+            ],
+        )
+        db.session.commit()
+
+        ids = []
+        req = self.client.get("/api/v1/posts/all/", headers=self.headers)
+
+        # bounded, so a cursor that never advances fails instead of hanging
+        for _ in range(10):
+            self.assertEqual(req.status_code, 200)
+            ids += [post["id"] for post in req.json]
+
+            if "X-Next-Cursor" not in req.headers:
+                break
+
+            req = self.client.get(
+                "/api/v1/posts/all/",
+                headers=self.headers,
+                query_string={"after": req.headers["X-Next-Cursor"]},
+            )
+
+        self.assertNotIn("X-Next-Cursor", req.headers)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(ids), 54)
+
     def test_get_post(self):
         req1 = self.client.get("/api/v1/posts/1/")
 
@@ -302,72 +565,43 @@ class PostRouteTest(unittest.TestCase):
 
         self.assertEqual(req2.status_code, 404)
 
+        req3 = self.client.get("/api/v1/posts/1/?fields=meta")
+
+        self.assertEqual(req3.status_code, 200)
+        self.assertEqual(req3.json["title"], "1")
+        self.assertEqual(req3.json["publisher"]["name"], "Tyler Durden")
+        self.assertNotIn("content", req3.json)
+        self.assertNotIn("media", req3.json)
+
 
-class PostRouteTest2(unittest.TestCase):
+class PostRouteTest2(DatabaseTestCase):
     def setUp(self):
-        self.app = create_app("testing")
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-        self.client = self.app.test_client()
+        super().setUp()
 
         self.publisher = Publisher()
         db.session.add(self.publisher)
         db.session.commit()
 
-        self.headers = {
-            "Authorization": "Basic {}".format(
-                b64encode(
-                    "{}:".format(self.publisher.generate_auth_token(120)).encode(
-                        "utf-8"
-                    )
-                ).decode("utf-8")
-            )
-        }
-
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
-
     def test_authorization(self):
         req1 = self.client.post("/api/v1/posts/")
 
         self.assertEqual(req1.status_code, 401)
 
     def test_create_post_400(self):
-        req1 = self.client.post(
-            "/api/v1/posts/",
-            headers=self.headers,
-        )
-        req2 = self.client.post("/api/v1/posts/", json={}, headers=self.headers)
-        req3 = self.client.post(
-            "/api/v1/posts/", json={"title": "abc"}, headers=self.headers
-        )
-        req4 = self.client.post(
-            "/api/v1/posts/", json={"content": "abc"}, headers=self.headers
-        )
-        req5 = self.client.post(
-            "/api/v1/posts/",
-            json={"content": "abc", "link": "abc"},
-            headers=self.headers,
-        )
-        req6 = self.client.post(
-            "/api/v1/posts/",
-            json={"content": "abc", "link": "abc"},
-            headers=self.headers,
-        )
-        req7 = self.client.post(
-            "/api/v1/posts/", json={"link": "abc"}, headers=self.headers
-        )
+        for data in (
+            None,
+            {},
+            {"title": "abc"},
+            {"content": "abc"},
+            {"content": "abc", "link": "abc"},
+            {"link": "abc"},
+        ):
+            with self.subTest(data=data):
+                req = self.client.post(
+                    "/api/v1/posts/", json=data, headers=self.headers
+                )
 
-        self.assertEqual(req1.status_code, 400)
-        self.assertEqual(req2.status_code, 400)
-        self.assertEqual(req3.status_code, 400)
-        self.assertEqual(req4.status_code, 400)
-        self.assertEqual(req5.status_code, 400)
-        self.assertEqual(req6.status_code, 400)
-        self.assertEqual(req7.status_code, 400)
+                self.assertEqual(req.status_code, 400)
 
     def test_create_post_now(self):
         req1 = self.client.post(
@@ -447,28 +681,14 @@ class PostRouteTest2(unittest.TestCase):
         self.assertEqual(req3.json["followup"], req2.json["id"])
 
 
-class PostRouteTest3(unittest.TestCase):
+class PostRouteTest3(DatabaseTestCase):
     def setUp(self):
-        self.app = create_app("testing")
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-        self.client = self.app.test_client()
+        super().setUp()
 
         self.publisher = Publisher()
         db.session.add(self.publisher)
         db.session.commit()
 
-        self.headers = {
-            "Authorization": "Basic {}".format(
-                b64encode(
-                    "{}:".format(self.publisher.generate_auth_token(120)).encode(
-                        "utf-8"
-                    )
-                ).decode("utf-8")
-            )
-        }
-
         self.posts = [
             Post(
                 title="a",
@@ -490,14 +710,9 @@ class PostRouteTest3(unittest.TestCase):
             Post(title="d", content="abc", published_at=None),
         ]
 
-        [db.session.add(post) for post in self.posts]
+        db.session.add_all(self.posts)
         db.session.commit()
 
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
-
     def test_media_posts(self):
         req1 = self.client.get("/api/v1/posts/media/")
 
@@ -512,17 +727,87 @@ class PostRouteTest3(unittest.TestCase):
         self.assertEqual(req1.status_code, 401)
         self.assertEqual(req2.status_code, 200)
         self.assertEqual(req3.status_code, 200)
-        self.assertEqual([post["title"] for post in req2.json], ["a", "b", "c", "d"])
+        self.assertEqual([post["title"] for post in req2.json], ["d", "c", "b", "a"])
         self.assertEqual([post["title"] for post in req3.json], ["c", "a"])
 
+    def test_admin_override_posts(self):
+        headers = _basic_auth("override")
+
+        with mock.patch.dict(self.app.config, {"ADMIN_OVERRIDE": "override"}):
+            req1 = self.client.post(
+                "/api/v1/posts/", json={"title": "e", "content": "e"}, headers=headers
+            )
+            req2 = self.client.post(
+                "/api/v1/posts/", json={"title": "f", "content": "f"}, headers=headers
+            )
+            req3 = self.client.post(
+                "/api/v1/posts/1/followup/",
+                json={"title": "g", "content": "g"},
+                headers=headers,
+            )
+
+        self.assertEqual(req1.status_code, 200)
+        self.assertEqual(req2.status_code, 200)
+        self.assertEqual(req3.status_code, 200)
+        # the override user is never saved
+        self.assertEqual(Publisher.query.count(), 1)
+
+    def test_post_preview(self):
+        image = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+
+        req1 = self.client.patch(
+            "/api/v1/posts/1/",
+            json={"preview_image": b64encode(image).decode("utf-8")},
+            headers=self.headers,
+        )
+        req2 = self.client.patch(
+            "/api/v1/posts/2/",
+            json={"preview_image": b64encode(image).decode("utf-8")},
+            headers=self.headers,
+        )
+
+        self.assertEqual(req1.status_code, 201)
+        self.assertEqual(req2.status_code, 201)
+
+        req3 = self.client.get("/api/v1/posts/media/")
+
+        self.assertEqual(req3.json[0]["preview"], "/api/v1/posts/1/preview/")
+
+        # requests share the session of the test, so start without loaded posts
+        db.session.expunge_all()
 
-class InterestRouteTest(unittest.TestCase):
+        with _statements(db.engine) as statements:
+            req4 = self.client.get(req3.json[0]["preview"])
+        req5 = self.client.get("/api/v1/posts/2/preview/")
+        req6 = self.client.get("/api/v1/posts/2/preview/", headers=self.headers)
+        req7 = self.client.get("/api/v1/posts/3/preview/")
+
+        self.assertEqual(req4.status_code, 200)
+        self.assertEqual(req4.mimetype, "image/png")
+        self.assertEqual(req4.data, image)
+        self.assertEqual(req5.status_code, 404)
+        self.assertEqual(req6.status_code, 200)
+        self.assertEqual(req7.status_code, 404)
+        self.assertEqual(req4.headers["X-Content-Type-Options"], "nosniff")
+        # interests of the post are not loaded for its preview
+        self.assertEqual(len(statements), 1)
+
+        html = b64encode(b"<script>alert(1)</script>").decode("utf-8")
+        req8 = self.client.patch(
+            "/api/v1/posts/1/",
+            json={"preview_image": "data:text/html;base64," + html},
+            headers=self.headers,
+        )
+        req9 = self.client.get("/api/v1/posts/1/preview/")
+
+        self.assertEqual(req8.status_code, 201)
+        self.assertEqual(req9.status_code, 200)
+        self.assertEqual(req9.mimetype, "application/octet-stream")
+
+
+class InterestRouteTest(DatabaseTestCase):
     def setUp(self):
-        self.app = create_app("testing")
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-        self.client = self.app.test_client()
+        super().setUp()
 
         self.publisher = Publisher()
         db.session.add(self.publisher)
@@ -531,35 +816,20 @@ class InterestRouteTest(unittest.TestCase):
         self.interest_1 = Interest(name="a")
         self.interest_2 = Interest(name="b")
 
-        db.session.add(self.interest_1)
-        db.session.add(self.interest_2)
-
-        for i in range(10):
-            post = Post(
-                title=str(i),
-                content=str(i),
-                published_at=datetime.fromisoformat("2022-03-02") - timedelta(days=i),
-                interests=[self.interest_1],
-            )
-            db.session.add(post)
-
+        db.session.add_all(
+            [self.interest_1, self.interest_2]
+            + [
+                Post(
+                    title=str(i),
+                    content=str(i),
+                    published_at=_BASE_DATE - timedelta(days=i),
+                    interests=[self.interest_1],
+                )
+                for i in range(10)
+            ]
+        )
         db.session.commit()
 
-        self.headers = {
-            "Authorization": "Basic {}".format(
-                b64encode(
-                    "{}:".format(self.publisher.generate_auth_token(120)).encode(
-                        "utf-8"
-                    )
-                ).decode("utf-8")
-            )
-        }
-
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-        self.app_context.pop()
-
     def test_authorization(self):
         req1 = self.client.get("/api/v1/interests/")
         req2 = self.client.put("/api/v1/interests/")
@@ -571,6 +841,48 @@ class InterestRouteTest(unittest.TestCase):
         self.assertEqual(req3.status_code, 401)
         self.assertEqual(req4.status_code, 401)
 
+    def test_interests(self):
+        req1 = self.client.put(
+            "/api/v1/interests/",
+            json={"name": "c", "description": "abc"},
+            headers=self.headers,
+        )
+        req2 = self.client.patch(
+            "/api/v1/interests/c/", json={"description": "def"}, headers=self.headers
+        )
+        req3 = self.client.get("/api/v1/interests/")
+
+        self.assertEqual(req1.status_code, 201)
+        self.assertEqual(req2.status_code, 201)
+        self.assertEqual(req3.status_code, 200)
+        self.assertIn({"name": "c", "description": "def"}, req3.json)
+
+        req4 = self.client.delete("/api/v1/interests/c/", headers=self.headers)
+        req5 = self.client.get("/api/v1/interests/")
+
+        self.assertEqual(req4.status_code, 201)
+        self.assertEqual([interest["name"] for interest in req5.json], ["a", "b"])
+
+    def test_interests_etag(self):
+        req1 = self.client.get("/api/v1/interests/")
+        etag = req1.headers["ETag"]
+        req2 = self.client.get("/api/v1/interests/", headers={"If-None-Match": etag})
+
+        self.assertEqual(req1.status_code, 200)
+        self.assertEqual(req2.status_code, 304)
+        self.assertEqual(req2.headers["ETag"], etag)
+
+        # changed by another process, then picked up by the periodic rebuild
+        db.session.add(Interest(name="c", description="abc"))
+        db.session.commit()
+        self.app.extensions["interests_cache"]["built_at"] = 0
+
+        req3 = self.client.get("/api/v1/interests/", headers={"If-None-Match": etag})
+
+        self.assertEqual(req3.status_code, 200)
+        self.assertNotEqual(req3.headers["ETag"], etag)
+        self.assertIn("c", [interest["name"] for interest in req3.json])
+
     def test_set_post_interest(self):
         req1 = self.client.patch(
             "/api/v1/posts/1/", json={"interests": ["a", "b"]}, headers=self.headers
@@ -645,6 +957,160 @@ class InterestRouteTest(unittest.TestCase):
         self.assertEqual([post["id"] for post in req2.json], [1, 3, 5, 7, 9])
         self.assertEqual([post["id"] for post in req3.json], [2, 4, 6, 8, 10])
 
+    def test_create_posts_bulk(self):
+        req1 = self.client.post(
+            "/api/v1/posts/bulk/",
+            json=[
+                {"title": "x", "content": "x", "interests": ["a", "b"]},
+                {"title": "y", "link": "y", "binary_content": "eQ=="},
+            ],
+            headers=self.headers,
+        )
+
+        self.assertEqual(req1.status_code, 200)
+        self.assertEqual(req1.json["ids"], [11, 12])
+
+        self.assertEqual(
+            sorted(interest.name for interest in db.session.get(Post, 11).interests),
+            ["a", "b"],
+        )
+        self.assertTrue(db.session.get(Post, 12).has_media)
+
+        req2 = self.client.post(
+            "/api/v1/posts/bulk/",
+            json=[{"title": "z", "content": "z", "interests": ["c"]}],
+            headers=self.headers,
+        )
+        req3 = self.client.post(
+            "/api/v1/posts/bulk/",
+            json=[{"title": "z", "content": "z"}, {"content": "z"}],
+            headers=self.headers,
+        )
+        req4 = self.client.post(
+            "/api/v1/posts/bulk/", json={"title": "z"}, headers=self.headers
+        )
+
+        self.assertEqual(req2.status_code, 400)
+        self.assertEqual(req3.status_code, 400)
+        self.assertEqual(req4.status_code, 400)
+
+        for data in (
+            {"title": "z", "content": "z", "interests": [{"a": 1}]},
+            {"title": "z", "content": "z", "interests": "a"},
+            {"title": "z", "content": "z", "publish_at": "x"},
+            {"title": "z", "content": "z", "publish_at": True},
+            {"title": "z", "content": "z", "publish_at": 1e20},
+        ):
+            with self.subTest(data=data):
+                req = self.client.post(
+                    "/api/v1/posts/bulk/", json=[data], headers=self.headers
+                )
+
+                self.assertEqual(req.status_code, 400)
+
+        self.assertEqual(Post.query.count(), 12)
+
+    def test_create_posts_bulk_batched(self):
+        with _statements(db.engine) as statements:
+            req = self.client.post(
+                "/api/v1/posts/bulk/",
+                json=[{"title": str(i), "content": str(i)} for i in range(50)],
+                headers=self.headers,
+            )
+
+        inserts = [s for s in statements if s.startswith("INSERT INTO post ")]
+
+        self.assertEqual(req.status_code, 200)
+        self.assertEqual(req.json["ids"], list(range(11, 61)))
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            [db.session.get(Post, id).title for id in (11, 60)], ["0", "49"]
+        )
+
+
+class CachedResponseTest(DatabaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # TestConfig disables caching, so listings are cached in memory here instead
+        cache.init_app(cls.app, config={"CACHE_TYPE": "SimpleCache"})
+
+    def setUp(self):
+        super().setUp()
+        # like the interest listing, cached responses would outlive the rollback
+        cache.clear()
+
+        db.session.add_all(
+            [Publisher()]
+            + [
+                Post(
+                    title=str(i),
+                    content=str(i),
+                    published_at=_BASE_DATE - timedelta(days=i),
+                )
+                for i in range(3)
+            ]
+        )
+        db.session.commit()
+
+    def _titles(self, path, **kwargs):
+        req = self.client.get(path, **kwargs)
+        self.assertEqual(req.status_code, 200)
+
+        return [post["title"] for post in req.json]
+
+    def test_cache_hit(self):
+        titles = self._titles("/api/v1/posts/recent/")
+
+        # not invalidated, so the cached listing is served
+        db.session.add(Post(title="3", content="3", published_at=_BASE_DATE))
+        db.session.commit()
+
+        self.assertEqual(self._titles("/api/v1/posts/recent/"), titles)
+        self.assertEqual(titles, ["0", "1", "2"])
+
+    def test_cached_authorization(self):
+        self._titles("/api/v1/posts/all/", headers=self.headers)
+
+        req1 = self.client.get("/api/v1/posts/all/")
+        req2 = self.client.get("/api/v1/posts/all/", headers=_basic_auth("invalid"))
+
+        self.assertEqual(req1.status_code, 401)
+        self.assertEqual(req2.status_code, 401)
+
+    def test_invalidate(self):
+        self._titles("/api/v1/posts/recent/")
+
+        req1 = self.client.post(
+            "/api/v1/posts/",
+            json={"title": "a", "content": "a", "publish_at": time.time() - 10},
+            headers=self.headers,
+        )
+
+        self.assertEqual(req1.status_code, 200)
+        self.assertEqual(self._titles("/api/v1/posts/recent/")[0], "a")
+
+        req2 = self.client.post(
+            "/api/v1/posts/bulk/",
+            json=[{"title": "b", "content": "b", "publish_at": time.time() - 5}],
+            headers=self.headers,
+        )
+
+        self.assertEqual(req2.status_code, 200)
+        self.assertEqual(self._titles("/api/v1/posts/recent/")[0], "b")
+
+    def test_evicted_version(self):
+        self._titles("/api/v1/posts/recent/")
+
+        db.session.add(
+            Post(title="a", content="a", published_at=_BASE_DATE + timedelta(days=1))
+        )
+        db.session.commit()
+        # an evicted version must not fall back to one that pages were cached under
+        cache.delete(LISTING_CACHE_VERSION)
+
+        self.assertEqual(self._titles("/api/v1/posts/recent/")[0], "a")
+
 
 if __name__ == "__main__":
     unittest.main()